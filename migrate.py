@@ -175,6 +175,7 @@ def migrate_state(state_path: Path, apply: bool):
         if last_upd is None or last_upd < cutoff_stale:
             # Use last_seen as the new baseline to preserve relative recency
             clean["last_updated"] = clean.get("last_seen", now_utc.isoformat())
+            clean.pop("last_updated_ts", None)  # epoch mirror; rebuilt by monitor.py
             reset_timer += 1
 
         to_keep[v_id] = clean
@@ -1,14 +1,25 @@
 import os
 import json
 import re
+from html import escape
 import shutil
 import requests
 import smtplib
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import attrgetter
 from email.mime.text import MIMEText
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
-from collections import defaultdict
+from typing import Dict, Optional, Sequence
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import defaultdict, namedtuple
+
+try:
+    import orjson  # optional: C-accelerated JSON for the feed and state files
+except ImportError:
+    orjson = None
 
 # ==========================================
 # ⚙️ CONFIGURATION & CONSTANTS
@@ -16,6 +27,7 @@ from collections import defaultdict
 TARGET_URL    = "https://www.anp.org.ma/_vti_bin/WS/Service.svc/mvmnv/all"
 STATE_FILE    = "state.json"
 HISTORY_FILE  = "history.json"
+HISTORY_LOG   = "history.ndjson"   # append-only journal of calls completed since the last report
 STATE_ENV_VAR = "VESSEL_STATE_DATA"
 
 EMAIL_USER         = os.getenv("EMAIL_USER")
@@ -23,19 +35,61 @@ EMAIL_PASS         = os.getenv("EMAIL_PASS")
 EMAIL_TO           = os.getenv("EMAIL_TO")
 EMAIL_TO_COLLEAGUE = os.getenv("EMAIL_TO_COLLEAGUE")
 
+def _env_int(name: str, default: int) -> int:
+    """Read an integer env var; blank or invalid values fall back to the default."""
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        print(f"[WARNING] Invalid {name}={raw!r}; using {default}")
+        return default
+
 SMTP_SERVER   = "smtp.gmail.com"
 SMTP_PORT     = 587
+# Max parallel SMTP connections (Gmail-safe); 1 sends everything over one session
+SMTP_WORKERS  = max(1, _env_int("SMTP_WORKERS", 3))
 EMAIL_ENABLED = str(os.getenv("EMAIL_ENABLED", "true")).lower() == "true"
 RUN_MODE      = os.getenv("RUN_MODE", "monitor")
+DEBUG_JSON    = str(os.getenv("DEBUG_JSON", "false")).lower() == "true"
+
 
 # Target Ports: Tan Tan (16), Laâyoune (17), Dakhla (18)
-ALLOWED_PORTS = {"16", "17", "18"}
+# The feed may deliver the port code as str or int — both forms are listed so
+# the ingest filter can test membership without a str() per row.
+ALLOWED_PORTS = frozenset({"16", "17", "18", 16, 17, 18})
+_PORT_NAMES   = {"16": "Tan Tan", "17": "Laâyoune", "18": "Dakhla"}
+_PORT_NAMES.update({int(k): v for k, v in _PORT_NAMES.items()})  # same for int codes
 
 # Status categories for tracking
 ANCHORAGE_STATUSES = {"EN RADE"}
 BERTH_STATUSES     = {"A QUAI"}
 COMPLETED_STATUSES = {"APPAREILLAGE", "TERMINE"}
 PLANNED_STATUSES   = {"PREVU"}
+EXPECTED_STATUSES  = frozenset(ANCHORAGE_STATUSES | BERTH_STATUSES | COMPLETED_STATUSES | PLANNED_STATUSES)
+
+# Subset of the raw ANP record kept in state.json for each active vessel
+ENTRY_FIELDS = (
+    "nOM_NAVIREField", "cONSIGNATAIREField", "cODE_SOCIETEField",
+    "nUMERO_LLOYDField", "nUMERO_ESCALEField", "pROVField",
+    "tYP_NAVIREField", "dATE_SITUATIONField", "hEURE_SITUATIONField",
+)
+
+# ==========================================
+# 🧾 JSON CODEC
+# ==========================================
+def _json_loads(raw: bytes):
+    """Decode JSON bytes with orjson when installed, else stdlib json."""
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def _json_dumps(obj, indent: bool = DEBUG_JSON) -> bytes:
+    """Encode to UTF-8 JSON bytes, indented only when DEBUG_JSON is set."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
 # ==========================================
 # ⚙️ STARTUP VALIDATION
@@ -56,41 +110,81 @@ def clean_status(raw_status: str) -> str:
     """Sanitize and validate status from API."""
     if not raw_status:
         return "UNKNOWN"
+    if raw_status in EXPECTED_STATUSES:
+        return raw_status  # the feed is normally clean already
     status = raw_status.strip().upper()
-    expected_statuses = {"PREVU", "EN RADE", "A QUAI", "APPAREILLAGE", "TERMINE"}
-    if status not in expected_statuses:
+    if status not in EXPECTED_STATUSES:
         print(f"[WARNING] Unexpected API Status: '{raw_status}'")
     return status
 
 # ==========================================
 # 🌐 NETWORK RESILIENCE
 # ==========================================
-def fetch_vessel_data_with_retry(max_retries=3, initial_delay=5):
-    """Fetch vessel data with full browser spoofing to bypass WAFs."""
+# One keep-alive session carries the browser-like headers for every request.
+# 'br' is not advertised: requests can only decode it with brotli installed.
+_HTTP = requests.Session()
+_HTTP.headers.update({
+    'User-Agent':      'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept':          'application/json, text/plain, */*',
+    'Accept-Language': 'fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Accept-Encoding': 'gzip, deflate',
+    'Referer':         'https://www.anp.org.ma/',
+    'Origin':          'https://www.anp.org.ma',
+    'Connection':      'keep-alive',
+    'Sec-Fetch-Dest':  'empty',
+    'Sec-Fetch-Mode':  'cors',
+    'Sec-Fetch-Site':  'same-origin',
+    'Pragma':          'no-cache',
+    'Cache-Control':   'no-cache',
+})
+# Only 502/503/504 responses are retried inside the adapter: at most 3 retries,
+# about 3s of backoff in total. Retry-After is ignored so a server cannot
+# stretch that wait (urllib3 would honour it for up to 6h). Connect errors and
+# read timeouts are left to the outer loop in fetch_vessel_data_with_retry
+# (which also covers WAF/bad-JSON cases), so a dead endpoint cannot multiply
+# the 60s read timeout past the job limit.
+_HTTP.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, connect=0, read=0, status=3,
+                      backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({"GET"}), raise_on_status=False,
+                      respect_retry_after_header=False),
+))
+
+def fetch_vessel_data_with_retry(max_retries=3, initial_delay=5, http_cache: Optional[Dict] = None):
+    """Fetch vessel data with full browser spoofing to bypass WAFs.
+
+    When ``http_cache`` holds an ``etag``/``last_modified`` from a previous run,
+    the request is made conditional; returns None if the feed is unchanged (304).
+    The dict is updated in place with the validators of a fresh response.
+    Only rows for ALLOWED_PORTS are returned; the rest of the feed is dropped here."""
+    http_cache = http_cache if http_cache is not None else {}
     for attempt in range(max_retries):
         try:
             print(f"[INFO] Fetching vessel data (attempt {attempt + 1}/{max_retries})")
-            headers = {
-                'User-Agent':      'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept':          'application/json, text/plain, */*',
-                'Accept-Language': 'fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Referer':         'https://www.anp.org.ma/',
-                'Origin':          'https://www.anp.org.ma',
-                'Connection':      'keep-alive',
-                'Sec-Fetch-Dest':  'empty',
-                'Sec-Fetch-Mode':  'cors',
-                'Sec-Fetch-Site':  'same-origin',
-                'Pragma':          'no-cache',
-                'Cache-Control':   'no-cache',
-            }
-            resp = requests.get(TARGET_URL, timeout=(10, 60), headers=headers)
+            headers = {}
+            if http_cache.get("etag"):
+                headers['If-None-Match'] = http_cache["etag"]
+            if http_cache.get("last_modified"):
+                headers['If-Modified-Since'] = http_cache["last_modified"]
+            resp = _HTTP.get(TARGET_URL, timeout=(10, 60), headers=headers)
+            if resp.status_code == 304:
+                print("[INFO] Feed not modified since last run (304)")
+                return None
             resp.raise_for_status()
-            data = resp.json()
+            data = _json_loads(resp.content)
             if not isinstance(data, list):
                 raise ValueError("API response is not a list")
-            print(f"[SUCCESS] Fetched {len(data)} vessel records")
-            return data
+            # Only monitored-port rows leave this function; the rest of the feed
+            # is released when it returns instead of living through the whole run
+            relevant = [e for e in data if e.get("cODE_SOCIETEField") in ALLOWED_PORTS]
+            print(f"[SUCCESS] Fetched {len(data)} vessel records ({len(relevant)} in monitored ports)")
+            print(f"[INFO] Transfer: {len(resp.content)} bytes decoded, "
+                  f"Content-Encoding={resp.headers.get('Content-Encoding') or 'identity'}")
+            http_cache["etag"]          = resp.headers.get("ETag")
+            http_cache["last_modified"] = resp.headers.get("Last-Modified")
+            return relevant
         except (requests.exceptions.RequestException, ValueError) as e:
             print(f"[WARNING] Attempt {attempt + 1} failed: {e}")
             if attempt < max_retries - 1:
@@ -106,10 +200,13 @@ def load_state() -> Dict:
     """Load state with multi-source validation."""
     if os.path.exists(STATE_FILE):
         try:
-            with open(STATE_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict) and "active" in data and "history" in data:
-                    return data
+            # Both decoders take UTF-8 bytes directly, skipping the text-mode layer
+            with open(STATE_FILE, "rb") as f:
+                raw = f.read()
+            # An empty file means "no state yet", not a decode error
+            data = _json_loads(raw) if raw.strip() else None
+            if isinstance(data, dict) and "active" in data and "history" in data:
+                return data
         except Exception as e:
             print(f"[WARNING] Local state load failed: {e}")
 
@@ -125,46 +222,116 @@ def load_state() -> Dict:
     return {"active": {}, "history": []}
 
 def save_state(state: Dict):
-    """Save state with transactional backup logic."""
+    """Save state with transactional backup logic.
+
+    Deliberately no flush()/os.fsync(): atomicity comes from os.replace, and
+    durability from the workflow committing the file right after the run.
+    Skips the backup and write when the encoded state is byte-identical to
+    the file on disk."""
     try:
+        # Encode in one shot and hand the OS a single write, not many small ones
+        payload = _json_dumps(state)
         if os.path.exists(STATE_FILE):
+            if os.path.getsize(STATE_FILE) == len(payload):
+                with open(STATE_FILE, "rb") as f:
+                    if f.read() == payload:
+                        print("[LOG] State unchanged on disk — skipping write.")
+                        return
             shutil.copy2(STATE_FILE, f"{STATE_FILE}.backup")
         temp_file = f"{STATE_FILE}.tmp"
-        with open(temp_file, "w", encoding="utf-8") as f:
-            json.dump(state, f, indent=2, ensure_ascii=False)
+        with open(temp_file, "wb") as f:
+            f.write(payload)
         os.replace(temp_file, STATE_FILE)
     except Exception as e:
         print(f"[CRITICAL] State save failed: {e}")
 
+def append_history_log(records: list) -> bool:
+    """Append completed calls to the NDJSON journal, one compact record per line.
+
+    Only the new records are written, so the cost no longer grows with the
+    size of the history. Like save_state, this never fsyncs.
+    Returns False if the journal could not be written."""
+    if not records:
+        return True
+    try:
+        with open(HISTORY_LOG, "ab") as f:
+            f.write(b"".join(_json_dumps(r, indent=False) + b"\n" for r in records))
+        return True
+    except Exception as e:
+        print(f"[CRITICAL] History journal append failed: {e}")
+        return False
+
+def load_history_log() -> list:
+    """Read every record from the journal, skipping corrupt lines."""
+    if not os.path.exists(HISTORY_LOG):
+        return []
+    records = []
+    with open(HISTORY_LOG, "rb") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(_json_loads(line))
+            except ValueError:
+                print(f"[WARNING] Skipping corrupt line {n} in {HISTORY_LOG}")
+    return records
+
 # ==========================================
 # 📅 DATE & TIME HELPERS
 # ==========================================
+# The feed repeats the same /Date(...)/ strings across rows, and the
+# helpers below are pure, so they are memoised.
+_MS_DATE_RE = re.compile(r"/Date\((\d+)(?:[+-]\d{4})?\)/")  # offset is matched, never captured
+
+MOROCCO_TZ = timezone(timedelta(hours=1))
+
+_JOURS_FR = ("Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche")
+_MOIS_FR  = ("janvier", "février", "mars", "avril", "mai", "juin",
+             "juillet", "août", "septembre", "octobre", "novembre", "décembre")
+
+@lru_cache(maxsize=4096)
 def parse_ms_date(date_str: str) -> Optional[datetime]:
+    """Parse a WCF '/Date(ms[+-HHMM])/' string into a UTC datetime."""
     if not date_str:
         return None
-    m = re.search(r"/Date\((\d+)([+-]\d{4})?\)/", date_str)
+    # Fast path: the feed always uses the fixed '/Date(' prefix, so slice it.
+    # Only the exact 'ms' or 'ms+HHMM' forms closed by ')/' are taken here;
+    # anything else goes to the regex so the accepted inputs stay the same.
+    if date_str.startswith("/Date("):
+        end = date_str.find(")", 6)
+        if end > 6 and date_str[end:end + 2] == ")/":
+            core = date_str[6:end]
+            if len(core) > 5 and core[-5] in "+-":
+                ms, offset = core[:-5], core[-4:]
+            else:
+                ms, offset = core, ""
+            offset_ok = not offset or (offset.isascii() and offset.isdigit())
+            if offset_ok and ms.isascii() and ms.isdigit():
+                return datetime.fromtimestamp(int(ms) / 1000.0, tz=timezone.utc)
+    elif "/Date(" not in date_str:
+        return None  # cannot match; skip the regex engine entirely
+    m = _MS_DATE_RE.search(date_str)
     if m:
         return datetime.fromtimestamp(int(m.group(1)) / 1000.0, tz=timezone.utc)
     return None
 
+@lru_cache(maxsize=4096)
 def fmt_dt(json_date: str) -> str:
     dt = parse_ms_date(json_date)
     if not dt:
         return "N/A"
-    dt_m = dt.astimezone(timezone(timedelta(hours=1)))
-    jours = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
-    mois  = ["janvier", "février", "mars", "avril", "mai", "juin",
-             "juillet", "août", "septembre", "octobre", "novembre", "décembre"]
-    return f"{jours[dt_m.weekday()].capitalize()}, {dt_m.day:02d} {mois[dt_m.month - 1]} {dt_m.year}"
+    dt_m = dt.astimezone(MOROCCO_TZ)
+    return f"{_JOURS_FR[dt_m.weekday()]}, {dt_m.day:02d} {_MOIS_FR[dt_m.month - 1]} {dt_m.year}"
 
+@lru_cache(maxsize=4096)
 def fmt_time_only(json_date: str) -> str:
     dt = parse_ms_date(json_date)
     if not dt:
         return "N/A"
-    return dt.astimezone(timezone(timedelta(hours=1))).strftime("%H:%M")
+    return dt.astimezone(MOROCCO_TZ).strftime("%H:%M")
 
-def port_name(code: str) -> str:
-    return {"16": "Tan Tan", "17": "Laâyoune", "18": "Dakhla"}.get(str(code), f"Port {code}")
+def port_name(code) -> str:
+    return _PORT_NAMES.get(code) or f"Port {code}"
 
 def _ensure_aware(dt: datetime) -> datetime:
     """Return a UTC-aware datetime, adding UTC tzinfo if the datetime is naive."""
@@ -172,24 +339,48 @@ def _ensure_aware(dt: datetime) -> datetime:
         return dt.replace(tzinfo=timezone.utc)
     return dt
 
-def _parse_last_seen(v: dict, fallback: datetime) -> datetime:
-    """Safely parse last_seen from a vessel dict; returns fallback on any error."""
+def _name_of(entry: dict) -> str:
+    """Vessel name of a raw ANP record, for subjects and logs."""
+    return entry.get("nOM_NAVIREField") or "Unknown"
+
+def _slim_entry(entry: dict) -> dict:
+    """Project a raw ANP record down to the fields persisted in state."""
+    return {k: entry[k] for k in ENTRY_FIELDS if k in entry}
+
+def _last_seen_ts(v: dict, fallback: datetime) -> float:
+    """Epoch of last_seen from a vessel dict; returns fallback on any error.
+
+    Reads the ``last_seen_ts`` mirror when present and only parses the ISO
+    ``last_seen`` string for entries written before it existed."""
+    ts = v.get("last_seen_ts")
+    if ts is not None:
+        return ts
     try:
-        return _ensure_aware(datetime.fromisoformat(v.get("last_seen", fallback.isoformat())))
+        return _ensure_aware(datetime.fromisoformat(v.get("last_seen", fallback.isoformat()))).timestamp()
     except (ValueError, TypeError):
-        return fallback
+        return fallback.timestamp()
 
 # ==========================================
 # 📊 ANALYTICS ENGINE
 # ==========================================
-def update_vessel_timers(active_vessel: Dict, new_status: str, now_utc: datetime) -> Dict:
+def update_vessel_timers(active_vessel: Dict, new_status: str, now_utc: datetime,
+                         now_iso: Optional[str] = None) -> Dict:
+    """Credit the time since the last update to the vessel's previous status.
+
+    Uses the epoch ``last_updated_ts`` when present; entries written before it
+    existed fall back to parsing the ISO ``last_updated`` string once.
+    Callers updating many vessels pass ``now_iso`` to share one isoformat()."""
     current_status   = active_vessel.get("current_status", "UNKNOWN")
+    last_updated_ts  = active_vessel.get("last_updated_ts")
     last_updated_str = active_vessel.get("last_updated")
+    now_ts           = now_utc.timestamp()
+    now_iso          = now_iso or now_utc.isoformat()
 
-    if last_updated_str:
+    if last_updated_ts is not None or last_updated_str:
         try:
-            last_updated  = _ensure_aware(datetime.fromisoformat(last_updated_str))
-            elapsed_hours = (now_utc - last_updated).total_seconds() / 3600.0
+            if last_updated_ts is None:
+                last_updated_ts = _ensure_aware(datetime.fromisoformat(last_updated_str)).timestamp()
+            elapsed_hours = (now_ts - last_updated_ts) / 3600.0
 
             if current_status in ANCHORAGE_STATUSES:
                 active_vessel["anchorage_hours"] = active_vessel.get("anchorage_hours", 0.0) + elapsed_hours
@@ -198,9 +389,11 @@ def update_vessel_timers(active_vessel: Dict, new_status: str, now_utc: datetime
         except Exception as e:
             print(f"[WARNING] Timer update failed: {e}")
 
-    active_vessel["current_status"] = new_status
-    active_vessel["last_updated"]   = now_utc.isoformat()
-    active_vessel["last_seen"]      = now_utc.isoformat()
+    active_vessel["current_status"]  = new_status
+    active_vessel["last_updated"]    = now_iso
+    active_vessel["last_updated_ts"] = now_ts
+    active_vessel["last_seen"]       = now_iso
+    active_vessel["last_seen_ts"]    = now_ts
     return active_vessel
 
 def calculate_performance_note(avg_anchorage: float, avg_berth: float) -> str:
@@ -218,30 +411,28 @@ def calculate_performance_note(avg_anchorage: float, avg_berth: float) -> str:
 # major email clients. No flexbox, no CSS
 # gradients, no box-shadow.
 # ==========================================
-def format_vessel_details_premium(entry: dict) -> str:
-    nom       = entry.get("nOM_NAVIREField")    or "INCONNU"
-    imo       = entry.get("nUMERO_LLOYDField")  or "N/A"
-    cons      = entry.get("cONSIGNATAIREField") or "N/A"
-    escale    = entry.get("nUMERO_ESCALEField") or "N/A"
-    eta_date  = fmt_dt(entry.get("dATE_SITUATIONField"))
-    eta_time  = fmt_time_only(entry.get("hEURE_SITUATIONField"))
-    prov      = entry.get("pROVField")          or "Inconnue"
-    type_nav  = entry.get("tYP_NAVIREField")    or "N/A"
-    p_name    = port_name(str(entry.get("cODE_SOCIETEField", "")))
-    generated = datetime.now().strftime("%d/%m/%Y à %H:%M")
-
-    def tile(label: str, value: str, bg: str, border: str) -> str:
-        return (
-            f'<div style="background:{bg};border-radius:5px;padding:8px 10px;'
-            f'border-left:3px solid {border};">'
-            f'<div style="font-family:Arial,sans-serif;font-size:8px;color:#7f8c8d;'
-            f'text-transform:uppercase;letter-spacing:1px;margin-bottom:3px;">{label}</div>'
-            f'<div style="font-family:Arial,sans-serif;font-size:13px;'
-            f'font-weight:bold;color:#1a252f;">{value}</div>'
-            f'</div>'
-        )
-
-    return f"""
+# Static card and tile markup, parsed once at import and filled per vessel
+_HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+_TAG_WS_RE       = re.compile(r">\s+<")
+_WS_RE           = re.compile(r"\s{2,}")
+
+def _minify_html(html: str) -> str:
+    """Drop comments and indentation from a static HTML template."""
+    html = _HTML_COMMENT_RE.sub("", html)
+    return _WS_RE.sub(" ", _TAG_WS_RE.sub("><", html)).strip()
+
+
+_TILE_TMPL = (
+    '<div style="background:{bg};border-radius:5px;padding:8px 10px;'
+    'border-left:3px solid {border};">'
+    '<div style="font-family:Arial,sans-serif;font-size:8px;color:#7f8c8d;'
+    'text-transform:uppercase;letter-spacing:1px;margin-bottom:3px;">{label}</div>'
+    '<div style="font-family:Arial,sans-serif;font-size:13px;'
+    'font-weight:bold;color:#1a252f;">{value}</div>'
+    '</div>'
+)
+
+_VESSEL_CARD_TMPL = """
     <table width="100%" cellpadding="0" cellspacing="0" border="0"
            style="max-width:460px;margin:16px auto;border:1px solid #d0d9e5;
                   border-radius:8px;overflow:hidden;font-family:Arial,sans-serif;">
@@ -293,12 +484,12 @@ def format_vessel_details_premium(entry: dict) -> str:
         <td width="50%" valign="top"
             style="padding:10px 6px 5px 10px;background:#ffffff;
                    border-bottom:1px solid #edf1f5;">
-          {tile("N&ordm;&nbsp;IMO", imo, "#f4f8fc", "#2e86c1")}
+          {tile_imo}
         </td>
         <td width="50%" valign="top"
             style="padding:10px 10px 5px 6px;background:#ffffff;
                    border-bottom:1px solid #edf1f5;">
-          {tile("N&ordm;&nbsp;Escale", escale, "#f4f8fc", "#2e86c1")}
+          {tile_escale}
         </td>
       </tr>
 
@@ -307,12 +498,12 @@ def format_vessel_details_premium(entry: dict) -> str:
         <td width="50%" valign="top"
             style="padding:5px 6px 5px 10px;background:#ffffff;
                    border-bottom:1px solid #edf1f5;">
-          {tile("Type", type_nav, "#fef9f0", "#e67e22")}
+          {tile_type}
         </td>
         <td width="50%" valign="top"
             style="padding:5px 10px 5px 6px;background:#ffffff;
                    border-bottom:1px solid #edf1f5;">
-          {tile("Consignataire", cons, "#fef9f0", "#e67e22")}
+          {tile_cons}
         </td>
       </tr>
 
@@ -321,7 +512,7 @@ def format_vessel_details_premium(entry: dict) -> str:
         <td colspan="2"
             style="padding:5px 10px 10px;background:#ffffff;
                    border-bottom:1px solid #edf1f5;">
-          {tile("Provenance", prov, "#f0f9f4", "#1e8449")}
+          {tile_prov}
         </td>
       </tr>
 
@@ -337,6 +528,36 @@ def format_vessel_details_premium(entry: dict) -> str:
       </tr>
 
     </table>"""
+# Minified once here rather than per send: the static markup is all that
+# carries whitespace, and feed values are left untouched.
+_VESSEL_CARD_TMPL = _minify_html(_VESSEL_CARD_TMPL)
+
+
+def _tile(label: str, value: str, bg: str, border: str) -> str:
+    return _TILE_TMPL.format_map({"label": label, "value": value, "bg": bg, "border": border})
+
+
+def format_vessel_details_premium(entry: dict) -> str:
+    # Feed values are escaped before they reach the HTML template
+    nom       = escape(str(entry.get("nOM_NAVIREField")    or "INCONNU"))
+    imo       = escape(str(entry.get("nUMERO_LLOYDField")  or "N/A"))
+    cons      = escape(str(entry.get("cONSIGNATAIREField") or "N/A"))
+    escale    = escape(str(entry.get("nUMERO_ESCALEField") or "N/A"))
+    prov      = escape(str(entry.get("pROVField")          or "Inconnue"))
+    type_nav  = escape(str(entry.get("tYP_NAVIREField")    or "N/A"))
+
+    return _VESSEL_CARD_TMPL.format_map({
+        "nom":         nom,
+        "p_name":      escape(port_name(entry.get("cODE_SOCIETEField", ""))),
+        "eta_date":    fmt_dt(entry.get("dATE_SITUATIONField")),
+        "eta_time":    fmt_time_only(entry.get("hEURE_SITUATIONField")),
+        "generated":   datetime.now().strftime("%d/%m/%Y à %H:%M"),
+        "tile_imo":    _tile("N&ordm;&nbsp;IMO",    imo,      "#f4f8fc", "#2e86c1"),
+        "tile_escale": _tile("N&ordm;&nbsp;Escale", escale,   "#f4f8fc", "#2e86c1"),
+        "tile_type":   _tile("Type",                type_nav, "#fef9f0", "#e67e22"),
+        "tile_cons":   _tile("Consignataire",       cons,     "#fef9f0", "#e67e22"),
+        "tile_prov":   _tile("Provenance",          prov,     "#f0f9f4", "#1e8449"),
+    })
 
 
 def _normalise_history_entry(h: dict) -> dict:
@@ -350,119 +571,251 @@ def _normalise_history_entry(h: dict) -> dict:
     return out
 
 
-def send_monthly_report(history: list, specific_port: str):
+# Flat view of one history record, built once per report so the aggregation
+# and row loops use attribute access instead of repeated dict.get() calls.
+TripRow = namedtuple("TripRow", "vessel agent anchorage_hours berth_hours departure")
+
+def _trip_row(h: dict) -> TripRow:
+    h = _normalise_history_entry(h)
+    return TripRow(
+        vessel          = h.get("vessel", "Unknown"),
+        agent           = h.get("agent", "Inconnu"),
+        anchorage_hours = h.get("anchorage_hours", 0),
+        berth_hours     = h.get("berth_hours", 0),
+        departure       = h.get("departure", ""),
+    )
+
+
+# Static skeleton of the monthly report, whitespace-collapsed once at import
+_REPORT_SHELL = (
+    '<div style="font-family:Arial;max-width:1100px;margin:auto;">'
+    '<div style="background:#0a3d62;color:white;padding:20px;border-radius:10px 10px 0 0;">'
+    '<h2 style="margin:0;">📊 Business Intelligence Report - {port}</h2>'
+    '<p>{total_calls} escales complétées | Données au {as_of}</p>'
+    '</div>'
+    '<div style="background:#f8f9fa;padding:25px;border:1px solid #d0d7e1;'
+    'border-top:none;border-radius:0 0 10px 10px;">'
+    '<div style="margin-bottom:30px;padding:15px;background:#e8f4fc;border-left:4px solid #3498db;">'
+    '<h3 style="margin:0;color:#2980b9;">📈 KPIs Clés du Port</h3>'
+    '<p><b>Attente Moy.:</b> {avg_anch}h &nbsp;|&nbsp; '
+    '<b>Quai Moy.:</b> {avg_berth}h &nbsp;|&nbsp; '
+    '<b>Total Moy.:</b> {avg_total}h</p>'
+    '</div>'
+    '<h3 style="color:#0a3d62;border-bottom:2px solid #0a3d62;">🏢 Performance des Agents</h3>'
+    '<table style="width:100%;border-collapse:collapse;background:white;margin-bottom:30px;">'
+    '<tr style="background:#2c3e50;color:white;">'
+    '<th style="padding:10px;">Agent</th>'
+    '<th style="padding:10px;">Escales</th>'
+    '<th style="padding:10px;">Attente</th>'
+    '<th style="padding:10px;">Quai</th>'
+    '<th style="padding:10px;">Note</th>'
+    '</tr>'
+    '{agent_rows}'
+    '</table>'
+    '<h3 style="color:#0a3d62;border-bottom:2px solid #0a3d62;">📋 Statistiques Navires</h3>'
+    '<table style="width:100%;border-collapse:collapse;background:white;font-size:13px;">'
+    '<tr style="background:#ecf0f1;">'
+    '<th style="padding:8px;">Navire</th>'
+    '<th style="padding:8px;">Agent</th>'
+    '<th style="padding:8px;">Attente</th>'
+    '<th style="padding:8px;">Quai</th>'
+    '<th style="padding:8px;">Total</th>'
+    '</tr>'
+    '{vessel_rows}'
+    '</table>'
+    '</div>'
+    '</div>'
+)
+
+_AGENT_ROW_TMPL = (
+    '<tr style="border-bottom:1px solid #e0e0e0;">'
+    '<td style="padding:10px;font-weight:bold;">{agent}</td>'
+    '<td style="padding:10px;text-align:center;">{calls}</td>'
+    '<td style="padding:10px;text-align:center;color:{a_color};">{a_anch}h</td>'
+    '<td style="padding:10px;text-align:center;color:{b_color};">{a_berth}h</td>'
+    '<td style="padding:10px;text-align:center;font-size:12px;">{note}</td>'
+    '</tr>'
+)
+
+_VESSEL_ROW_TMPL = (
+    '<tr style="border-bottom:1px solid #f0f0f0;">'
+    '<td style="padding:8px;font-weight:bold;">{vessel}</td>'
+    '<td style="padding:8px;">{agent}</td>'
+    '<td style="padding:8px;text-align:center;">{anch}h</td>'
+    '<td style="padding:8px;text-align:center;">{berth}h</td>'
+    '<td style="padding:8px;text-align:center;font-weight:bold;">{total}h</td>'
+    '</tr>'
+)
+
+
+def build_monthly_report(history: list, specific_port: str):
+    """Return the (subject, html body) of one port's monthly report, or None."""
     if not history:
-        return
-
-    history = [_normalise_history_entry(h) for h in history]
+        return None
 
-    total_calls = len(history)
-    total_anch  = sum(h.get("anchorage_hours", 0) for h in history)
-    total_berth = sum(h.get("berth_hours",     0) for h in history)
+    trips = [_trip_row(h) for h in history]
+
+    # One pass fills both the per-agent accumulators [calls, anchorage h,
+    # berth h] and the port-wide totals.
+    agent_stats = defaultdict(lambda: [0, 0.0, 0.0])
+    total_anch = total_berth = 0.0
+    for t in trips:
+        a = agent_stats[t.agent]
+        a[0] += 1
+        a[1] += t.anchorage_hours
+        a[2] += t.berth_hours
+        total_anch  += t.anchorage_hours
+        total_berth += t.berth_hours
+
+    total_calls = len(trips)
     avg_anch    = round(total_anch  / total_calls, 1) if total_calls > 0 else 0
     avg_berth   = round(total_berth / total_calls, 1) if total_calls > 0 else 0
     avg_total   = round(avg_anch + avg_berth, 1)
 
-    agent_stats = defaultdict(lambda: {"calls": 0, "total_anch": 0.0, "total_berth": 0.0})
-    for h in history:
-        agent = h.get("agent", "Inconnu")
-        agent_stats[agent]["calls"]       += 1
-        agent_stats[agent]["total_anch"]  += h.get("anchorage_hours", 0)
-        agent_stats[agent]["total_berth"] += h.get("berth_hours", 0)
-
-    agent_rows = ""
-    for agent, data in sorted(agent_stats.items(), key=lambda x: x[1]["calls"], reverse=True):
-        a_anch  = round(data["total_anch"]  / data["calls"], 1) if data["calls"] > 0 else 0
-        a_berth = round(data["total_berth"] / data["calls"], 1) if data["calls"] > 0 else 0
-        note    = calculate_performance_note(a_anch, a_berth)
-        a_color = "#e74c3c" if a_anch  > 12 else "#27ae60"
-        b_color = "#f39c12" if a_berth > 36 else "#27ae60"
-        agent_rows += f"""
-        <tr style="border-bottom:1px solid #e0e0e0;">
-            <td style="padding:10px;font-weight:bold;">{agent}</td>
-            <td style="padding:10px;text-align:center;">{data['calls']}</td>
-            <td style="padding:10px;text-align:center;color:{a_color};">{a_anch}h</td>
-            <td style="padding:10px;text-align:center;color:{b_color};">{a_berth}h</td>
-            <td style="padding:10px;text-align:center;font-size:12px;">{note}</td>
-        </tr>"""
-
-    vessel_rows = ""
-    for h in sorted(history, key=lambda x: x.get("departure", ""), reverse=True):
-        anch  = round(h.get("anchorage_hours", 0), 1)
-        berth = round(h.get("berth_hours",     0), 1)
-        vessel_rows += f"""
-        <tr style="border-bottom:1px solid #f0f0f0;">
-            <td style="padding:8px;font-weight:bold;">{h['vessel']}</td>
-            <td style="padding:8px;">{h.get('agent', '-')}</td>
-            <td style="padding:8px;text-align:center;">{anch}h</td>
-            <td style="padding:8px;text-align:center;">{berth}h</td>
-            <td style="padding:8px;text-align:center;font-weight:bold;">{round(anch + berth, 1)}h</td>
-        </tr>"""
+    agent_parts = []
+    for agent, (calls, t_anch, t_berth) in sorted(agent_stats.items(), key=lambda x: x[1][0], reverse=True):
+        a_anch  = round(t_anch  / calls, 1) if calls > 0 else 0
+        a_berth = round(t_berth / calls, 1) if calls > 0 else 0
+        agent_parts.append(_AGENT_ROW_TMPL.format_map({
+            "agent":   escape(str(agent)),
+            "calls":   calls,
+            "a_anch":  a_anch,
+            "a_berth": a_berth,
+            "a_color": "#e74c3c" if a_anch  > 12 else "#27ae60",
+            "b_color": "#f39c12" if a_berth > 36 else "#27ae60",
+            "note":    calculate_performance_note(a_anch, a_berth),
+        }))
+    agent_rows = "".join(agent_parts)
+
+    vessel_parts = []
+    for t in sorted(trips, key=attrgetter("departure"), reverse=True):
+        anch  = round(t.anchorage_hours, 1)
+        berth = round(t.berth_hours,     1)
+        vessel_parts.append(_VESSEL_ROW_TMPL.format_map({
+            "vessel": escape(str(t.vessel)),
+            "agent":  escape(str(t.agent)),
+            "anch":   anch,
+            "berth":  berth,
+            "total":  round(anch + berth, 1),
+        }))
+    vessel_rows = "".join(vessel_parts)
 
     subject = f"📊 Rapport Mensuel BI : Port de {specific_port} ({total_calls} Escales)"
-    body = f"""
-    <div style="font-family:Arial;max-width:1100px;margin:auto;">
-        <div style="background:#0a3d62;color:white;padding:20px;border-radius:10px 10px 0 0;">
-            <h2 style="margin:0;">📊 Business Intelligence Report - {specific_port}</h2>
-            <p>{total_calls} escales complétées | Données au {datetime.now().strftime('%d/%m/%Y')}</p>
-        </div>
-        <div style="background:#f8f9fa;padding:25px;border:1px solid #d0d7e1;
-                    border-top:none;border-radius:0 0 10px 10px;">
-            <div style="margin-bottom:30px;padding:15px;background:#e8f4fc;
-                        border-left:4px solid #3498db;">
-                <h3 style="margin:0;color:#2980b9;">📈 KPIs Clés du Port</h3>
-                <p><b>Attente Moy.:</b> {avg_anch}h &nbsp;|&nbsp;
-                   <b>Quai Moy.:</b> {avg_berth}h &nbsp;|&nbsp;
-                   <b>Total Moy.:</b> {avg_total}h</p>
-            </div>
-            <h3 style="color:#0a3d62;border-bottom:2px solid #0a3d62;">🏢 Performance des Agents</h3>
-            <table style="width:100%;border-collapse:collapse;background:white;margin-bottom:30px;">
-                <tr style="background:#2c3e50;color:white;">
-                    <th style="padding:10px;">Agent</th>
-                    <th style="padding:10px;">Escales</th>
-                    <th style="padding:10px;">Attente</th>
-                    <th style="padding:10px;">Quai</th>
-                    <th style="padding:10px;">Note</th>
-                </tr>
-                {agent_rows}
-            </table>
-            <h3 style="color:#0a3d62;border-bottom:2px solid #0a3d62;">📋 Statistiques Navires</h3>
-            <table style="width:100%;border-collapse:collapse;background:white;font-size:13px;">
-                <tr style="background:#ecf0f1;">
-                    <th style="padding:8px;">Navire</th>
-                    <th style="padding:8px;">Agent</th>
-                    <th style="padding:8px;">Attente</th>
-                    <th style="padding:8px;">Quai</th>
-                    <th style="padding:8px;">Total</th>
-                </tr>
-                {vessel_rows}
-            </table>
-        </div>
-    </div>"""
-
-    send_email(EMAIL_TO, subject, body)
-
-
-def send_email(to: Optional[str], sub: str, body: str):
-    """Send an HTML email. Skips silently if disabled, config missing, or no recipient."""
+    body = _REPORT_SHELL.format_map({
+        "port":        escape(specific_port),
+        "total_calls": total_calls,
+        "as_of":       datetime.now().strftime('%d/%m/%Y'),
+        "avg_anch":    avg_anch,
+        "avg_berth":   avg_berth,
+        "avg_total":   avg_total,
+        "agent_rows":  agent_rows,
+        "vessel_rows": vessel_rows,
+    })
+    return subject, body
+
+
+class SMTPSession:
+    """Authenticated SMTP connection shared by several send_email calls.
+
+    Nothing is opened until the first send(); a connection the server has
+    dropped in the meantime is reopened once, transparently. smtplib is not
+    thread-safe, so use one session per thread."""
+
+    def __init__(self):
+        self._server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+        try:
+            server.starttls()
+            server.login(EMAIL_USER, EMAIL_PASS)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+
+    def send(self, recipients: Sequence[str], wire: bytes) -> Dict:
+        """Send one message; returns sendmail's {address: (code, msg)} of refused
+        recipients (empty if all were accepted; raises only if all were refused)."""
+        if self._server is None:
+            self._connect()
+        try:
+            return self._server.sendmail(EMAIL_USER, recipients, wire)
+        except smtplib.SMTPServerDisconnected:
+            print("[WARNING] Shared SMTP session dropped — reconnecting.")
+            self._server.close()
+            self._connect()
+            return self._server.sendmail(EMAIL_USER, recipients, wire)
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except smtplib.SMTPException:
+            self._server.close()
+        self._server = None
+
+
+def send_email(to: Optional[str], sub: str, body: str, bcc: Sequence[str] = (),
+               session: Optional[SMTPSession] = None):
+    """Send an HTML email. Skips silently if disabled, config missing, or no recipient.
+
+    Addresses in ``bcc`` are added to the SMTP envelope only, so the same
+    message is delivered to everyone in a single transaction. Pass an open
+    ``session`` to reuse its connection; otherwise a one-shot one is used."""
     if not EMAIL_ENABLED or not EMAIL_USER or not to:
         if EMAIL_ENABLED and EMAIL_USER and not to:
             print("[WARNING] send_email called with no recipient — skipping.")
         return
+    recipients = [to] + [r for r in bcc if r]
     msg = MIMEText(body, "html", "utf-8")
     msg["Subject"] = sub
     msg["From"]    = EMAIL_USER
     msg["To"]      = to
+    wire = msg.as_bytes()  # serialise once, outside the open SMTP session
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASS)
-            server.sendmail(EMAIL_USER, [to], msg.as_bytes())
-        print(f"[SUCCESS] Email sent to {to}")
+        if session is not None:
+            refused = session.send(recipients, wire)
+        else:
+            with SMTPSession() as one_shot:
+                refused = one_shot.send(recipients, wire)
+        # One envelope for everyone: a partial refusal does not raise
+        for addr, (code, reason) in refused.items():
+            print(f"[WARNING] Recipient refused: {addr} ({code} {reason!r})")
+        accepted = [r for r in recipients if r not in refused]
+        print(f"[SUCCESS] Email sent to {', '.join(accepted)}")
     except Exception as e:
         print(f"[ERROR] Email failed: {e}")
 
 
+def send_batch(messages: list):
+    """Send (to, subject, body, bcc) tuples concurrently across SMTP_WORKERS threads.
+
+    smtplib connections are not thread-safe, so each worker opens its own
+    session and reuses it for its share of the messages."""
+    if not messages:
+        return
+    workers = min(SMTP_WORKERS, len(messages))
+
+    def _worker(chunk: list):
+        with SMTPSession() as session:
+            for to, sub, body, bcc in chunk:
+                send_email(to, sub, body, bcc=bcc, session=session)
+
+    if workers == 1:
+        _worker(messages)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_worker, [messages[i::workers] for i in range(workers)]))
+
+
 # ==========================================
 # 🔄 MAIN PROCESS
 # ==========================================
@@ -478,123 +831,156 @@ def main():
 
     # ── REPORT MODE ──────────────────────────────────────────
     if RUN_MODE == "report":
-        for p_code in ALLOWED_PORTS:
-            p_name = port_name(p_code)
-            p_hist = [h for h in history if h.get("port") == p_name]
-            if p_hist:
-                send_monthly_report(p_hist, p_name)
+        # Calls left in state by older versions come first, then the journal
+        history = history + load_history_log()
+
+        # Group once instead of re-scanning the whole history for every port
+        by_port = defaultdict(list)
+        for h in history:
+            by_port[h.get("port")].append(h)
+
+        # Ports are independent: build every report, then send them concurrently
+        reports = []
+        for p_name in sorted({port_name(c) for c in ALLOWED_PORTS}):
+            report = build_monthly_report(by_port.get(p_name), p_name)
+            if report:
+                reports.append((EMAIL_TO, *report, ()))
+        send_batch(reports)
 
         # Archive completed history to file, then clear state
         if os.path.exists(HISTORY_FILE):
             try:
-                with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                    old = json.load(f)
-                    if isinstance(old, list):
-                        history = old + history
+                with open(HISTORY_FILE, "rb") as f:
+                    old = _json_loads(f.read())
+                if isinstance(old, list):
+                    history = old + history
             except Exception as e:
                 print(f"[WARNING] Could not read history archive: {e}")
 
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
+        with open(HISTORY_FILE, "wb") as f:
+            f.write(_json_dumps(history))
 
+        # Archived: start a fresh journal (kept as an empty file for the workflow)
+        open(HISTORY_LOG, "wb").close()
         state["history"] = []
         save_state(state)
         print("[LOG] Monthly reports and archiving completed.")
         return
 
     # ── MONITOR MODE ─────────────────────────────────────────
+    http_cache   = state.setdefault("http_cache", {})
+    cache_before = dict(http_cache)
     try:
-        all_data = fetch_vessel_data_with_retry()
+        all_data = fetch_vessel_data_with_retry(http_cache=http_cache)
     except Exception as e:
         print(f"[CRITICAL] API Failure: {e}")
         return
 
-    now_utc      = datetime.now(timezone.utc)
-    live_vessels = {}
+    if all_data is None:
+        # Unchanged feed: timers resume from last_updated on the next real change
+        print("[LOG] No changes in feed — skipping processing.")
+        return
 
+    now_utc   = datetime.now(timezone.utc)
+    now_iso   = now_utc.isoformat()  # identical for every row; format it once
+    now_ts    = now_utc.timestamp()
+    first_run = not active
+    alerts    = {}
+    completed = []
+    dirty     = http_cache != cache_before  # set whenever state must be rewritten
+
+    # ── SINGLE PASS: TRACKING + NEW ARRIVALS ─────────────────
+    # Each feed row is dispatched straight to the tracking or new-arrival branch,
+    # without building an intermediate table of live vessels first.
+    # Ghost ships (tracked but absent from the feed) are never visited here: their
+    # timers freeze and last_seen is preserved, which is what allows the cutoff
+    # below to eventually expire them.
     for e in all_data:
-        port_code = str(e.get("cODE_SOCIETEField", ""))
-        if port_code in ALLOWED_PORTS:
-            status = clean_status(e.get("sITUATIONField"))
-            v_id   = f"{e.get('nUMERO_LLOYDField', '0')}-{e.get('nUMERO_ESCALEField', '0')}"
-            live_vessels[v_id] = {"e": e, "status": status}
-
-    alerts, to_remove = {}, []
-
-    # ── TRACKING LOOP ────────────────────────────────────────
-    for v_id, stored in active.items():
-        live = live_vessels.get(v_id)
-        if live:
+        status = clean_status(e.get("sITUATIONField"))
+        v_id   = f"{e.get('nUMERO_LLOYDField', '0')}-{e.get('nUMERO_ESCALEField', '0')}"
+        stored = active.get(v_id)
+
+        if stored is not None:
+            entry = stored["entry"]
+            dirty = True
+
             # Update elapsed time counters
-            stored = update_vessel_timers(stored, live["status"], now_utc)
+            update_vessel_timers(stored, status, now_utc, now_iso)
 
             # Move to history when vessel completes its call
-            if live["status"] in COMPLETED_STATUSES:
-                history.append({
-                    "vessel":          stored["entry"].get("nOM_NAVIREField", "Unknown"),
-                    "agent":           stored["entry"].get("cONSIGNATAIREField", "Inconnu"),
-                    "port":            port_name(stored["entry"].get("cODE_SOCIETEField")),
+            if status in COMPLETED_STATUSES:
+                completed.append({
+                    "vessel":          entry.get("nOM_NAVIREField", "Unknown"),
+                    "agent":           entry.get("cONSIGNATAIREField", "Inconnu"),
+                    "port":            port_name(entry.get("cODE_SOCIETEField")),
                     "anchorage_hours": round(stored.get("anchorage_hours", 0.0), 1),
                     "berth_hours":     round(stored.get("berth_hours",     0.0), 1),
-                    "arrival":         stored.get("first_seen", now_utc.isoformat()),
-                    "departure":       now_utc.isoformat(),
+                    "arrival":         stored.get("first_seen", now_iso),
+                    "departure":       now_iso,
                 })
-                to_remove.append(v_id)
-
-            stored["entry"] = live["e"]
-        else:
-            # Ghost ship: vessel disappeared from API — freeze timers, keep in state briefly.
-            # Do NOT update last_seen here; preserving the last API-seen timestamp is what
-            # allows the 3-day cutoff below to eventually expire this entry.
-            pass
-
-    for vid in to_remove:
-        active.pop(vid, None)
-
-    # ── NEW ARRIVALS ─────────────────────────────────────────
-    for v_id, live in live_vessels.items():
-        if v_id not in active:
-            # First-run safety: skip vessels already present that aren't newly planned
-            if len(active) == 0 and live["status"] not in PLANNED_STATUSES:
-                continue
-
-            active[v_id] = {
-                "entry":           live["e"],
-                "current_status":  live["status"],
-                "anchorage_hours": 0.0,
-                "berth_hours":     0.0,
-                "first_seen":      now_utc.isoformat(),
-                "last_updated":    now_utc.isoformat(),
-                "last_seen":       now_utc.isoformat(),
-            }
-            if live["status"] in PLANNED_STATUSES:
-                p = port_name(live["e"].get("cODE_SOCIETEField"))
-                alerts.setdefault(p, []).append(live["e"])
+                del active[v_id]
+            else:
+                stored["entry"] = _slim_entry(e)
+            continue
+
+        # ── NEW ARRIVAL ──────────────────────────────────────
+        # A call first seen already completed has no timings worth recording
+        if status in COMPLETED_STATUSES:
+            continue
+        # First-run safety: skip vessels already present that aren't newly planned
+        if first_run and status not in PLANNED_STATUSES:
+            continue
+
+        dirty = True
+        active[v_id] = {
+            "entry":           _slim_entry(e),
+            "current_status":  status,
+            "anchorage_hours": 0.0,
+            "berth_hours":     0.0,
+            "first_seen":      now_iso,
+            "last_updated":    now_iso,
+            "last_updated_ts": now_ts,
+            "last_seen":       now_iso,
+            "last_seen_ts":    now_ts,
+        }
+        if status in PLANNED_STATUSES:
+            alerts.setdefault(port_name(e.get("cODE_SOCIETEField")), []).append(e)
 
     # ── CLEANUP & SAVE ───────────────────────────────────────
-    cutoff = now_utc - timedelta(hours=24)
+    cutoff_ts = (now_utc - timedelta(hours=24)).timestamp()
     state["active"] = {
         k: v for k, v in active.items()
-        if _parse_last_seen(v, now_utc) > cutoff
+        if _last_seen_ts(v, now_utc) > cutoff_ts
     }
-    state["history"] = history[-1000:]
-    save_state(state)
+    dirty = dirty or len(state["active"]) != len(active)
+
+    # Journal new calls (plus any left in state by older versions); only keep
+    # them in state if the journal write fails, so nothing is lost.
+    pending = history + completed
+    if pending:
+        state["history"] = [] if append_history_log(pending) else pending[-1000:]
+        dirty = True
+
+    if dirty:
+        save_state(state)
+    else:
+        print("[LOG] No state changes — skipping save.")
 
     # ── SEND ALERTS ──────────────────────────────────────────
-    if alerts:
-        for p, vessels in alerts.items():
-            names = ", ".join(v.get("nOM_NAVIREField", "Unknown") for v in vessels)
-            body  = (
-                f'<p style="font-family:Arial,sans-serif;font-size:14px;">'
-                f'Bonjour,<br>Mouvements pr&#233;vus au Port de <b>{p}</b>&nbsp;:</p>'
-                + "".join(format_vessel_details_premium(v) for v in vessels)
-            )
-            subject = f"NOUVELLE ARRIVÉE | {names} au Port de {p}"
-            send_email(EMAIL_TO, subject, body)
-            if p == "Laâyoune" and EMAIL_TO_COLLEAGUE:
-                send_email(EMAIL_TO_COLLEAGUE, subject, body)
-
-    print(f"[STATS] Tracking {len(state['active'])} vessels | History: {len(history)}")
+    messages = []
+    for p, vessels in alerts.items():
+        names = ", ".join(map(_name_of, vessels))
+        body  = (
+            f'<p style="font-family:Arial,sans-serif;font-size:14px;">'
+            f'Bonjour,<br>Mouvements pr&#233;vus au Port de <b>{p}</b>&nbsp;:</p>'
+            + "".join(map(format_vessel_details_premium, vessels))
+        )
+        subject = f"NOUVELLE ARRIVÉE | {names} au Port de {p}"
+        bcc     = [EMAIL_TO_COLLEAGUE] if p == "Laâyoune" and EMAIL_TO_COLLEAGUE else []
+        messages.append((EMAIL_TO, subject, body, bcc))
+    send_batch(messages)
+
+    print(f"[STATS] Tracking {len(state['active'])} vessels | Completed this run: {len(completed)}")
 
 
 if __name__ == "__main__":